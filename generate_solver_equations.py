@@ -16,144 +16,31 @@ For full expansion of all RK4 stages, a symbolic mathematics library like SymPy
 
 import argparse
 import os
-import re
 from collections import OrderedDict
 
-def clean_function_args(args_str):
-    """Clean up function arguments to use standard mathematical notation."""
-    # Handle patterns like "- h + r" -> "r - h"
-    args_str = re.sub(r'- h \+ r', r'r - h', args_str)
-    args_str = re.sub(r'- 2h \+ r', r'r - 2h', args_str)
-    args_str = re.sub(r'- ([0-9]*h) \+ r', r'r - \1', args_str)
-    args_str = re.sub(r'h \+ r', r'r + h', args_str)
-    args_str = re.sub(r'2h \+ r', r'r + 2h', args_str)
-    args_str = re.sub(r'([0-9]*h) \+ r', r'r + \1', args_str)
-    
-    # Handle theta patterns  
-    args_str = re.sub(r'- h \+ \\theta', r'\\theta - h', args_str)
-    args_str = re.sub(r'h \+ \\theta', r'\\theta + h', args_str)
-    
-    # Remove any remaining \left and \right
-    args_str = re.sub(r'\\left\(', r'', args_str)
-    args_str = re.sub(r'\\right\)', r'', args_str)
-    
-    return args_str.strip()
-
-def clean_latex_expression(expr):
-    """
-    Clean LaTeX expression by removing problematic operatorname patterns
-    and fixing delimiter balancing issues.
-    """
-    # Step 1: Handle problematic \operatorname{bigl} patterns with nested \left...\right 
-    # Use a pattern that can handle nested structures
-    pattern = r'\\operatorname\{bigl\}\{\\left\((.*\\right.*?)\\right\)\}'
-    
-    def replace_operatorname(match):
-        content = match.group(1)
-        # Extract the innermost content by removing the outer \right) and finding the matching \left(
-        # This handles cases like: r,\left( t + \Delta t \right)
-        return f'\\bigl({content}\\bigr)'
-    
-    # Apply the replacement
-    while re.search(pattern, expr):
-        expr = re.sub(pattern, replace_operatorname, expr)
-    
-    # Step 1b: Handle simpler operatorname patterns without nested structures
-    simple_pattern = r'\\operatorname\{bigl\}\{([^}]*)\}'
-    expr = re.sub(simple_pattern, r'\\bigl(\1\\bigr)', expr)
-    
-    # Step 2: Fix mathematical notation - ensure proper spacing and formatting
-    expr = re.sub(r'dtheta', r'd\\theta', expr)  # Fix theta notation
-    expr = re.sub(r'\\,\\,', r'\\,', expr)  # Remove double spacing
-    
-    # Step 3: Clean up function calls  
-    # Handle the special case where "bigr" appears before function names in the original text
-    # This is not a LaTeX command but part of the mathematical expression
-    expr = re.sub(r'- bigr f\{', r'-\\,f{', expr)
-    expr = re.sub(r'\\bbigr f\{', r'f{', expr)
-    
-    # Handle f{\left(...\right)} patterns and clean up the arguments
-    def clean_function_call(match):
-        args = match.group(1)
-        cleaned_args = clean_function_args(args)
-        return f'f({cleaned_args})'
-    
-    # Match f{...} patterns with various LaTeX constructs inside
-    expr = re.sub(r'f\{\\left\(([^}]*)\)\\right\}', clean_function_call, expr)
-    expr = re.sub(r'f\{([^}]*)\}', clean_function_call, expr)
-    
-    return expr
-
-def parse_stencil_file(path):
-    """
-    Parse a stencil .tex file to extract the finite difference approximation.
-    Extracts the RHS of the approximation equation.
-    """
-    with open(path, encoding='utf-8') as f:
-        text = f.read()
-    
-    # Extract variable, order, and the approximation equation
-    variable_match = re.search(r'% Variable: (\w+)', text)
-    order_match = re.search(r'% Order: (.+)', text)
-    
-    variable = variable_match.group(1) if variable_match else "unknown"
-    order = order_match.group(1) if order_match else "unknown"
-    
-    # Extract the approximation equation - look for content between \approx and \quad
-    # This should capture the mathematical expression but stop before accuracy notes
-    approx_match = re.search(r'\\approx\s*(.*?)(?=\\quad|\\\\|\$|\n|$)', text, re.DOTALL)
-    
-    if not approx_match:
-        print(f"Warning: Could not find approximation in {path}")
-        return None
-    
-    approximation = approx_match.group(1).strip()
-    
-    # Clean up any remaining LaTeX document structure that got included
-    approximation = re.sub(r'\\end\{document\}.*', '', approximation, flags=re.DOTALL)
-    approximation = re.sub(r'\\begin\{.*?\}', '', approximation)
-    approximation = re.sub(r'\\end\{.*?\}', '', approximation)
-    
-    # Clean the LaTeX expression
-    cleaned_approximation = clean_latex_expression(approximation)
-    
-    return {
-        'variable': variable,
-        'order': order,
-        'path': path,
-        'approximation': cleaned_approximation
-    }
+from solver_equations_common import (
+    STENCIL_CACHE_FILE,
+    load_stencil_cache,
+    parse_stencil_files,
+    save_stencil_cache,
+    validate_latex_balance,
+)
 
-def validate_latex_balance(latex_content):
-    """
-    Validate that LaTeX delimiters are properly balanced.
-    """
-    # Count math block delimiters
-    math_open = latex_content.count(r'\[')
-    math_close = latex_content.count(r'\]')
-    
-    # Count bigl/bigr pairs
-    bigl_count = len(re.findall(r'\\bigl\(', latex_content))
-    bigr_count = len(re.findall(r'\\bigr\)', latex_content))
-    
-    # Count parentheses within math blocks
-    math_blocks = re.findall(r'\\\\.*?\\\\', latex_content, re.DOTALL)
-    paren_balance = 0
-    for block in math_blocks:
-        paren_balance += block.count('(') - block.count(')')
-    
-    issues = []
-    if math_open != math_close:
-        issues.append(f"Math blocks unbalanced: {math_open} \\[ vs {math_close} \\]")
-    if bigl_count != bigr_count:
-        issues.append(f"bigl/bigr unbalanced: {bigl_count} \\bigl( vs {bigr_count} \\bigr)")
-    if paren_balance != 0:
-        issues.append(f"Parentheses unbalanced in math blocks: {paren_balance}")
-    
-    if issues:
-        return False, "; ".join(issues)
-    else:
-        return True, "All delimiters balanced"
+# Per-stencil k1 blocks, filled from the parsed stencil dict
+_MINIMAL_STENCIL_TEMPLATE = (
+    "% {variable} derivative ({order})\n"
+    "\\[\n"
+    "k_1^{{({variable})}} = \\Delta t \\cdot \\left( {approximation} \\right)\n"
+    "\\]\n\n"
+)
+_FULL_STENCIL_TEMPLATE = (
+    "For {variable} derivative ({order}):\n"
+    "\\[\n"
+    "k_1^{{({variable})}} = \\Delta t \\cdot \\left( {approximation} \\right)\n"
+    "\\]\n\n"
+)
+# Emitted instead of the k1 block for placeholder stencils (both output modes)
+_PLACEHOLDER_STENCIL_TEMPLATE = "% {variable} derivative ({order}): placeholder stencil, skipped\n\n"
 
 def main():
     parser = argparse.ArgumentParser(
@@ -184,13 +71,31 @@ def main():
         action="store_true", 
         help="Validate LaTeX syntax balance after generation"
     )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        help="Worker processes used to parse stencil files (default: CPU count; 1 disables)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Always reparse stencil files instead of using {STENCIL_CACHE_FILE}"
+    )
     args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error(f"--jobs must be at least 1, got {args.jobs}")
+
+    cache = None if args.no_cache else load_stencil_cache(STENCIL_CACHE_FILE)
 
     # Find all stencil files
-    stencil_files = []
-    for filename in os.listdir(args.input_dir):
-        if filename.startswith('stencil_') and filename.endswith('.tex'):
-            stencil_files.append(os.path.join(args.input_dir, filename))
+    with os.scandir(args.input_dir) as entries:
+        stencil_files = [
+            entry.path for entry in entries
+            if entry.name.startswith('stencil_') and entry.name.endswith('.tex')
+            and entry.is_file()
+        ]
+    stencil_files.sort()
     
     if not stencil_files:
         print(f"No stencil_*.tex files found in {args.input_dir}")
@@ -198,8 +103,8 @@ def main():
     
     # Parse all stencil files
     stencils = OrderedDict()
-    for path in sorted(stencil_files):
-        stencil = parse_stencil_file(path)
+    parsed = parse_stencil_files(stencil_files, cache, args.jobs)
+    for path, stencil in zip(stencil_files, parsed):
         if stencil:
             # Create a key from variable and order
             key = f"{stencil['variable']}_{stencil['order']}"
@@ -208,98 +113,106 @@ def main():
                 print(f"Parsed {os.path.basename(path)}: {key}")
                 print(f"  Approximation: {stencil['approximation'][:100]}...")
     
+    if cache is not None:
+        save_stencil_cache(STENCIL_CACHE_FILE, cache)
+    
     if not stencils:
         print("No valid stencil files could be parsed")
         return 1
 
-    # Generate the LaTeX document
+    # Generate the LaTeX document, collecting fragments and writing them once
+    parts = []
     if args.minimal:
         # Begin minimal LaTeX output (no document preamble for downstream processing)
-        with open(args.output, "w", encoding='utf-8') as out:
-            # Generate RK4 equations
-            out.write("% RK4 Solver Update Equations\n\n")
-            
-            # Stage k1: Use the finite difference approximations directly
-            out.write("% Stage k1: Spatial discretization\n")
-            for key, stencil in stencils.items():
-                out.write(f"% {stencil['variable']} derivative ({stencil['order']})\n")
-                out.write("\\[\n")
-                out.write(f"k_1^{{({stencil['variable']})}} = \\Delta t \\cdot \\left( {stencil['approximation']} \\right)\n")
-                out.write("\\]\n\n")
-            
-            # Stages k2, k3, k4: Use functional notation
-            out.write("% Stage k2: Half-step using k1\n")
-            out.write("\\[\n")
-            out.write("k_2 = \\Delta t \\cdot F\\left(X^n + \\frac{k_1}{2}\\right)\n")
-            out.write("\\]\n\n")
-            
-            out.write("% Stage k3: Half-step using k2\n")
-            out.write("\\[\n")
-            out.write("k_3 = \\Delta t \\cdot F\\left(X^n + \\frac{k_2}{2}\\right)\n")
-            out.write("\\]\n\n")
-            
-            out.write("% Stage k4: Full step using k3\n")
-            out.write("\\[\n")
-            out.write("k_4 = \\Delta t \\cdot F\\left(X^n + k_3\\right)\n")
-            out.write("\\]\n\n")
-            
-            # Final update
-            out.write("% Final RK4 update\n")
-            out.write("\\[\n")
-            out.write("X^{n+1} = X^n + \\frac{1}{6}\\left(k_1 + 2k_2 + 2k_3 + k_4\\right)\n")
-            out.write("\\]\n")
+        parts.append("% RK4 Solver Update Equations\n\n")
+        
+        # Stage k1: Use the finite difference approximations directly
+        parts.append("% Stage k1: Spatial discretization\n")
+        for stencil in stencils.values():
+            if stencil.get('is_placeholder'):
+                parts.append(_PLACEHOLDER_STENCIL_TEMPLATE.format_map(stencil))
+            else:
+                parts.append(_MINIMAL_STENCIL_TEMPLATE.format_map(stencil))
+        
+        # Stages k2, k3, k4: Use functional notation
+        parts.append(
+            "% Stage k2: Half-step using k1\n"
+            "\\[\n"
+            "k_2 = \\Delta t \\cdot F\\left(X^n + \\frac{k_1}{2}\\right)\n"
+            "\\]\n\n"
+            "% Stage k3: Half-step using k2\n"
+            "\\[\n"
+            "k_3 = \\Delta t \\cdot F\\left(X^n + \\frac{k_2}{2}\\right)\n"
+            "\\]\n\n"
+            "% Stage k4: Full step using k3\n"
+            "\\[\n"
+            "k_4 = \\Delta t \\cdot F\\left(X^n + k_3\\right)\n"
+            "\\]\n\n"
+        )
+        
+        # Final update
+        parts.append(
+            "% Final RK4 update\n"
+            "\\[\n"
+            "X^{n+1} = X^n + \\frac{1}{6}\\left(k_1 + 2k_2 + 2k_3 + k_4\\right)\n"
+            "\\]\n"
+        )
     else:
         # Full LaTeX document
-        with open(args.output, "w", encoding='utf-8') as out:
-            out.write("\\documentclass{article}\n")
-            out.write("\\usepackage{amsmath}\n")
-            out.write("\\usepackage{amsfonts}\n")
-            out.write("\\usepackage{amssymb}\n")
-            out.write("\\title{RK4 Solver Update Equations}\n")
-            out.write("\\author{Generated from finite difference stencils}\n")
-            out.write("\\date{\\today}\n\n")
-            out.write("\\begin{document}\n")
-            out.write("\\maketitle\n\n")
-            
-            out.write("\\section{Fourth-Order Runge-Kutta Time Integration}\n\n")
-            
-            out.write("This document presents the RK4 solver update equations based on ")
-            out.write("finite difference spatial discretizations.\n\n")
-            
-            # Generate RK4 equations
-            out.write("\\subsection{Stage k1: Spatial Discretization}\n\n")
-            out.write("The first stage uses the finite difference approximations directly:\n\n")
-            
-            for key, stencil in stencils.items():
-                out.write(f"For {stencil['variable']} derivative ({stencil['order']}):\n")
-                out.write("\\[\n")
-                out.write(f"k_1^{{({stencil['variable']})}} = \\Delta t \\cdot \\left( {stencil['approximation']} \\right)\n")
-                out.write("\\]\n\n")
-            
-            # Stages k2, k3, k4: Use functional notation
-            out.write("\\subsection{Stages k2, k3, k4: Functional Notation}\n\n")
-            out.write("For stages k2-k4, we use functional notation F(...) since full expansion ")
-            out.write("would require symbolic manipulation of complex expressions:\n\n")
-            
-            out.write("\\[\n")
-            out.write("k_2 = \\Delta t \\cdot F\\left(X^n + \\frac{k_1}{2}\\right)\n")
-            out.write("\\]\n\n")
-            
-            out.write("\\[\n")
-            out.write("k_3 = \\Delta t \\cdot F\\left(X^n + \\frac{k_2}{2}\\right)\n")
-            out.write("\\]\n\n")
-            
-            out.write("\\[\n")
-            out.write("k_4 = \\Delta t \\cdot F\\left(X^n + k_3\\right)\n")
-            out.write("\\]\n\n")
-            
-            # Final update
-            out.write("\\subsection{Final Update}\n\n")
-            out.write("\\[\n")
-            out.write("X^{n+1} = X^n + \\frac{1}{6}\\left(k_1 + 2k_2 + 2k_3 + k_4\\right)\n")
-            out.write("\\]\n\n")
-            
-            out.write("\\end{document}\n")
+        parts.append(
+            "\\documentclass{article}\n"
+            "\\usepackage{amsmath}\n"
+            "\\usepackage{amsfonts}\n"
+            "\\usepackage{amssymb}\n"
+            "\\title{RK4 Solver Update Equations}\n"
+            "\\author{Generated from finite difference stencils}\n"
+            "\\date{\\today}\n\n"
+            "\\begin{document}\n"
+            "\\maketitle\n\n"
+            "\\section{Fourth-Order Runge-Kutta Time Integration}\n\n"
+            "This document presents the RK4 solver update equations based on "
+            "finite difference spatial discretizations.\n\n"
+        )
+        
+        # Generate RK4 equations
+        parts.append(
+            "\\subsection{Stage k1: Spatial Discretization}\n\n"
+            "The first stage uses the finite difference approximations directly:\n\n"
+        )
+        
+        for stencil in stencils.values():
+            if stencil.get('is_placeholder'):
+                parts.append(_PLACEHOLDER_STENCIL_TEMPLATE.format_map(stencil))
+            else:
+                parts.append(_FULL_STENCIL_TEMPLATE.format_map(stencil))
+        
+        # Stages k2, k3, k4: Use functional notation
+        parts.append(
+            "\\subsection{Stages k2, k3, k4: Functional Notation}\n\n"
+            "For stages k2-k4, we use functional notation F(...) since full expansion "
+            "would require symbolic manipulation of complex expressions:\n\n"
+            "\\[\n"
+            "k_2 = \\Delta t \\cdot F\\left(X^n + \\frac{k_1}{2}\\right)\n"
+            "\\]\n\n"
+            "\\[\n"
+            "k_3 = \\Delta t \\cdot F\\left(X^n + \\frac{k_2}{2}\\right)\n"
+            "\\]\n\n"
+            "\\[\n"
+            "k_4 = \\Delta t \\cdot F\\left(X^n + k_3\\right)\n"
+            "\\]\n\n"
+        )
+        
+        # Final update
+        parts.append(
+            "\\subsection{Final Update}\n\n"
+            "\\[\n"
+            "X^{n+1} = X^n + \\frac{1}{6}\\left(k_1 + 2k_2 + 2k_3 + k_4\\right)\n"
+            "\\]\n\n"
+            "\\end{document}\n"
+        )
+    
+    with open(args.output, "w", encoding='utf-8') as out:
+        out.write(''.join(parts))
 
     print(f"Generated {args.output} with {len(stencils)} stencils.")
     
@@ -309,7 +222,7 @@ def main():
             content = f.read()
         
         # Check for any remaining problematic patterns
-        operatorname_count = len(re.findall(r'\\operatorname\{bigl\}', content))
+        operatorname_count = content.count(r'\operatorname{bigl}')
         if operatorname_count > 0:
             print(f"Warning: {operatorname_count} unresolved \\operatorname{{bigl}} patterns found")
         
@@ -0,0 +1,322 @@
+r"""
+Shared stencil parsing, LaTeX cleaning and validation helpers for the RK4
+solver equation generator (generate_solver_equations.py).
+
+All regexes are compiled once at import time, so every tool importing this
+module shares them along with the clean_* memoization caches.
+"""
+
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# Argument rewrites applied by clean_function_args, in order
+_ARG_REWRITES = [
+    (re.compile(r'- h \+ r'), r'r - h'),
+    (re.compile(r'- 2h \+ r'), r'r - 2h'),
+    (re.compile(r'- ([0-9]*h) \+ r'), r'r - \1'),
+    (re.compile(r'h \+ r'), r'r + h'),
+    (re.compile(r'2h \+ r'), r'r + 2h'),
+    (re.compile(r'([0-9]*h) \+ r'), r'r + \1'),
+    # Theta patterns
+    (re.compile(r'- h \+ \\theta'), r'\\theta - h'),
+    (re.compile(r'h \+ \\theta'), r'\\theta + h'),
+    # Any remaining \left and \right
+    (re.compile(r'\\left\('), r''),
+    (re.compile(r'\\right\)'), r''),
+]
+
+# Patterns used by clean_latex_expression
+# \operatorname{bigl}{\left(...\right)} with nested \left...\right inside. This
+# used to be the regex r'\\operatorname\{bigl\}\{\\left\((.*\\right.*?)\\right\)\}',
+# whose greedy/lazy pair is quadratic per match attempt on long lines; it is
+# now matched with find/rfind in _replace_nested_operatorname instead.
+_OPERATORNAME_NESTED_START = r'\operatorname{bigl}{\left('
+_OPERATORNAME_NESTED_END = r'\right)}'
+_RIGHT = r'\right'
+_OPERATORNAME_SIMPLE_RE = re.compile(r'\\operatorname\{bigl\}\{([^}]*)\}')
+# Single-pass notation and function-call rewrites. Alternatives are tried in
+# order, so f{\left(...\right)} takes precedence over the generic f{...} form.
+# The bigr prefixes only consume up to the f{ so the call itself is still
+# rewritten by the function-call alternatives.
+_EXPRESSION_RE = re.compile(
+    r'(?P<dtheta>dtheta)'
+    r'|(?P<double_space>\\,\\,)'
+    r'|(?P<neg_bigr>- bigr (?=f\{))'
+    r'|(?P<bigr>\\bbigr (?=f\{))'
+    r'|f\{\\left\((?P<lr_args>[^}]*)\)\\right\}'
+    r'|f\{(?P<args>[^}]*)\}'
+)
+_TOKEN_REPLACEMENTS = {
+    'dtheta': r'd\theta',   # Fix theta notation
+    'double_space': r'\,',  # Remove double spacing
+    'neg_bigr': r'-\,',
+    'bigr': '',
+}
+
+# Patterns used by parse_stencil_file
+# Variable, order and approximation headers in a single scan. Each alternative
+# is a zero-width lookahead so no match consumes text, and every field gets its
+# first occurrence exactly as a separate search would find it.
+_HEADER_RE = re.compile(
+    r'(?=% Variable: (?P<variable>\w+))'
+    r'|(?=% Order: (?P<order>.+))'
+    r'|(?=\\approx\s*(?P<approximation>(?s:.*?))(?=\\quad|\\\\|\$|\n|$))'
+)
+_HEADER_FIELD_COUNT = 3
+# Text left in stencil files that have no generated approximation yet
+_PLACEHOLDER_MARKER = 'a begin i m p t x'
+_END_DOCUMENT_RE = re.compile(r'\\end\{document\}.*', re.DOTALL)
+_BEGIN_ENV_RE = re.compile(r'\\begin\{.*?\}')
+_END_ENV_RE = re.compile(r'\\end\{.*?\}')
+
+# Pattern used by validation
+_LINE_BREAK_BLOCK_RE = re.compile(r'\\\\.*?\\\\', re.DOTALL)
+
+@lru_cache(maxsize=4096)
+def clean_function_args(args_str):
+    """Clean up function arguments to use standard mathematical notation."""
+    for pattern, replacement in _ARG_REWRITES:
+        args_str = pattern.sub(replacement, args_str)
+    
+    return args_str.strip()
+
+def _replace_nested_operatorname(expr):
+    r"""
+    Replace each nested \operatorname{bigl}{\left(...\right)} with
+    \bigl(...\bigr), returning (new_expr, count) like re.subn.
+    
+    The content runs from after \left( to the first \right)} following the
+    last \right on the same line that still has a \right)} after it, which is
+    what the original greedy/lazy regex matched, but each line is scanned a
+    constant number of times per replacement, so a line full of unterminated
+    starts costs one pass instead of one pass per start.
+    """
+    parts = []
+    copied = 0
+    count = 0
+    start = expr.find(_OPERATORNAME_NESTED_START)
+    while start >= 0:
+        content_start = start + len(_OPERATORNAME_NESTED_START)
+        line_end = expr.find('\n', content_start)
+        if line_end < 0:
+            line_end = len(expr)
+        last_end = expr.rfind(_OPERATORNAME_NESTED_END, content_start, line_end)
+        inner_right = expr.rfind(_RIGHT, content_start, last_end) if last_end >= 0 else -1
+        if inner_right < 0:
+            # Later starts on this line search a sub-range of this one, so
+            # they cannot match either; resume on the next line
+            start = expr.find(_OPERATORNAME_NESTED_START, line_end)
+            continue
+        content_end = expr.find(_OPERATORNAME_NESTED_END, inner_right + len(_RIGHT), line_end)
+        parts.append(expr[copied:start])
+        parts.append(f'\\bigl({expr[content_start:content_end]}\\bigr)')
+        copied = content_end + len(_OPERATORNAME_NESTED_END)
+        count += 1
+        start = expr.find(_OPERATORNAME_NESTED_START, copied)
+    
+    if not count:
+        return expr, 0
+    parts.append(expr[copied:])
+    return ''.join(parts), count
+
+def _rewrite_expression(match):
+    """
+    Replacement callback for _EXPRESSION_RE. "bigr" can appear before function
+    names in the original text; this is not a LaTeX command but part of the
+    mathematical expression.
+    """
+    kind = match.lastgroup
+    if kind in ('lr_args', 'args'):
+        # Apply the notation fixes to the arguments before cleaning them
+        args = _EXPRESSION_RE.sub(_rewrite_expression, match.group(kind))
+        return f'f({clean_function_args(args)})'
+    return _TOKEN_REPLACEMENTS[kind]
+
+@lru_cache(maxsize=4096)
+def clean_latex_expression(expr):
+    """
+    Clean LaTeX expression by removing problematic operatorname patterns
+    and fixing delimiter balancing issues.
+    """
+    # Step 1: Handle problematic \operatorname{bigl} patterns with nested \left...\right
+    # This handles cases like: r,\left( t + \Delta t \right)
+    # Apply the replacement until no nested patterns remain
+    while True:
+        expr, count = _replace_nested_operatorname(expr)
+        if count == 0:
+            break
+    
+    # Step 1b: Handle simpler operatorname patterns without nested structures
+    expr = _OPERATORNAME_SIMPLE_RE.sub(r'\\bigl(\1\\bigr)', expr)
+    
+    # Step 2: Fix notation and clean up function calls in a single pass
+    expr = _EXPRESSION_RE.sub(_rewrite_expression, expr)
+    
+    return expr
+
+# On-disk cache of parsed stencils; bump the version whenever parsing or
+# cleaning changes so stale entries are discarded
+STENCIL_CACHE_FILE = '.stencil_cache.json'
+_STENCIL_CACHE_VERSION = 2
+
+def _stencil_cache_key(path):
+    """Return the cache key identifying the current contents of a stencil file."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+def load_stencil_cache(cache_path):
+    """
+    Load previously parsed stencils, keyed by (abspath, mtime_ns, size).
+    Returns an empty cache if the file is missing, unreadable or outdated.
+    """
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    
+    if not isinstance(data, dict) or data.get('version') != _STENCIL_CACHE_VERSION:
+        return {}
+    return {
+        (entry['path'], entry['mtime_ns'], entry['size']): entry['stencil']
+        for entry in data.get('entries', [])
+    }
+
+def save_stencil_cache(cache_path, cache):
+    """Write the stencil cache, dropping entries for files that changed or vanished."""
+    entries = []
+    for key, stencil in cache.items():
+        path, mtime_ns, size = key
+        try:
+            if _stencil_cache_key(path) != key:
+                continue
+        except OSError:
+            continue
+        entries.append({'path': path, 'mtime_ns': mtime_ns, 'size': size, 'stencil': stencil})
+    
+    try:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': _STENCIL_CACHE_VERSION, 'entries': entries}, f)
+    except OSError as e:
+        print(f"Warning: Could not write stencil cache {cache_path}: {e}")
+
+def parse_stencil_file(path):
+    """
+    Parse a stencil .tex file to extract the finite difference approximation.
+    Extracts the RHS of the approximation equation.
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    
+    # Extract variable, order, and the approximation equation in a single scan.
+    # The approximation is the content between \approx and \quad, stopping
+    # before accuracy notes.
+    fields = {}
+    for match in _HEADER_RE.finditer(text):
+        fields.setdefault(match.lastgroup, match.group(match.lastgroup))
+        if len(fields) == _HEADER_FIELD_COUNT:
+            break
+    
+    variable = fields.get('variable', "unknown")
+    order = fields.get('order', "unknown")
+    
+    if 'approximation' not in fields:
+        print(f"Warning: Could not find approximation in {path}")
+        return None
+    
+    approximation = fields['approximation'].strip()
+    
+    # Placeholder stencils carry no real expression, so skip cleaning entirely
+    if _PLACEHOLDER_MARKER in approximation:
+        return {
+            'variable': variable,
+            'order': order,
+            'path': path,
+            'approximation': approximation,
+            'is_placeholder': True
+        }
+    
+    # Clean up any remaining LaTeX document structure that got included; the
+    # substring checks skip the regex scans in the usual case where none is present
+    if r'\end{document}' in approximation:
+        approximation = _END_DOCUMENT_RE.sub('', approximation)
+    if r'\begin{' in approximation:
+        approximation = _BEGIN_ENV_RE.sub('', approximation)
+    if r'\end{' in approximation:
+        approximation = _END_ENV_RE.sub('', approximation)
+    
+    # Clean the LaTeX expression
+    cleaned_approximation = clean_latex_expression(approximation)
+    
+    return {
+        'variable': variable,
+        'order': order,
+        'path': path,
+        'approximation': cleaned_approximation,
+        'is_placeholder': False
+    }
+
+def parse_stencil_files(paths, cache=None, jobs=None):
+    """
+    Parse stencil files, returning results in the same order as paths.
+    
+    If a cache dict is given, unchanged files are served from it and newly
+    parsed files are added to it. The remaining files are parsed in up to
+    `jobs` worker processes (default: CPU count; 1 parses in-process).
+    """
+    if jobs is not None and jobs < 1:
+        raise ValueError(f"jobs must be at least 1, got {jobs}")
+    results = {}
+    pending = []
+    for path in paths:
+        cache_key = _stencil_cache_key(path) if cache is not None else None
+        if cache_key is not None and cache_key in cache:
+            results[path] = cache[cache_key]
+        else:
+            pending.append((path, cache_key))
+    
+    pending_paths = [path for path, _ in pending]
+    if jobs != 1 and len(pending_paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            parsed = list(executor.map(parse_stencil_file, pending_paths, chunksize=4))
+    else:
+        parsed = [parse_stencil_file(path) for path in pending_paths]
+    
+    for (path, cache_key), stencil in zip(pending, parsed):
+        results[path] = stencil
+        if cache is not None and stencil:
+            cache[cache_key] = stencil
+    
+    return [results[path] for path in paths]
+
+def validate_latex_balance(latex_content):
+    """
+    Validate that LaTeX delimiters are properly balanced.
+    """
+    # Count math block delimiters
+    math_open = latex_content.count(r'\[')
+    math_close = latex_content.count(r'\]')
+    
+    # Count bigl/bigr pairs
+    bigl_count = latex_content.count(r'\bigl(')
+    bigr_count = latex_content.count(r'\bigr)')
+    
+    # Count parentheses within math blocks
+    math_text = ''.join(_LINE_BREAK_BLOCK_RE.findall(latex_content))
+    paren_balance = math_text.count('(') - math_text.count(')')
+    
+    issues = []
+    if math_open != math_close:
+        issues.append(f"Math blocks unbalanced: {math_open} \\[ vs {math_close} \\]")
+    if bigl_count != bigr_count:
+        issues.append(f"bigl/bigr unbalanced: {bigl_count} \\bigl( vs {bigr_count} \\bigr)")
+    if paren_balance != 0:
+        issues.append(f"Parentheses unbalanced in math blocks: {paren_balance}")
+    
+    if issues:
+        return False, "; ".join(issues)
+    else:
+        return True, "All delimiters balanced"
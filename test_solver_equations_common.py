@@ -0,0 +1,58 @@
+"""
+Regression tests for the nested \\operatorname{bigl} rewrite in
+solver_equations_common, which replaced a greedy/lazy regex with str scans.
+
+Run with `python -m unittest` (or pytest).
+"""
+
+import random
+import re
+import time
+import unittest
+
+from solver_equations_common import _replace_nested_operatorname
+
+# The pattern and replacement used before the rewrite; the scan must agree
+_ORIGINAL_NESTED_RE = re.compile(r'\\operatorname\{bigl\}\{\\left\((.*\\right.*?)\\right\)\}')
+_ORIGINAL_REPLACEMENT = r'\\bigl(\1\\bigr)'
+
+# Fragments that exercise every branch: full and partial starts, bare and
+# closing \right variants, stray delimiters, and line breaks
+_TOKENS = [
+    r'\operatorname{bigl}{\left(', r'\operatorname{bigl}{', r'\left(',
+    r'\right', r'\right)', r'\right)}', '}', ')', '(', '\n', 'x', ' ',
+    '\\', 'right', r'\r',
+]
+
+class ReplaceNestedOperatornameTest(unittest.TestCase):
+
+    def test_matches_original_regex_on_random_token_strings(self):
+        rng = random.Random(20240611)
+        for _ in range(20000):
+            expr = ''.join(rng.choice(_TOKENS) for _ in range(rng.randint(0, 24)))
+            with self.subTest(expr=expr):
+                self.assertEqual(
+                    _replace_nested_operatorname(expr),
+                    _ORIGINAL_NESTED_RE.subn(_ORIGINAL_REPLACEMENT, expr),
+                )
+
+    def test_stencil_style_expression(self):
+        # One nested argument list per line, as stencil files lay them out
+        expr = (r'f\{\operatorname{bigl}{\left(r + h,\left( t + \Delta t \right)\right)}\} -' '\n'
+                r'f\{\operatorname{bigl}{\left(r - h,\left( t \right)\right)}\}')
+        self.assertEqual(
+            _replace_nested_operatorname(expr),
+            (r'f\{\bigl(r + h,\left( t + \Delta t \right)\bigr)\} -' '\n'
+             r'f\{\bigl(r - h,\left( t \right)\bigr)\}', 2),
+        )
+
+    def test_long_line_of_unterminated_starts_is_linear(self):
+        # A quadratic scan takes tens of seconds here; a linear one takes
+        # milliseconds, so the bound is generous enough not to be flaky
+        expr = (r'\operatorname{bigl}{\left(x \right ' * 50000) + 'y'
+        began = time.perf_counter()
+        self.assertEqual(_replace_nested_operatorname(expr), (expr, 0))
+        self.assertLess(time.perf_counter() - began, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()